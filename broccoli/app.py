@@ -1,5 +1,10 @@
+from __future__ import annotations
+import os
+import sys
+import types
 import typing
-from uuid import uuid4
+import secrets
+import itertools
 from . interfaces import App, Broker, Router, Task
 from . types import Args, Kwargs, QueueName, TaskId
 from . utils import cached_property, load_class
@@ -9,6 +14,27 @@ from . exceptions import TimedOut
 __all__ = ('App',)
 
 
+# Task ids only need to be unique; a per-process random prefix plus a
+# local counter gives the same 32 hex chars as uuid4().hex without a
+# getrandom(2) syscall and hex formatting per dispatch.
+_ID_PREFIX = secrets.token_hex(8)
+_ID_COUNTER = itertools.count().__next__
+
+
+def _reseed_id_prefix():
+    global _ID_PREFIX, _ID_COUNTER
+    _ID_PREFIX = secrets.token_hex(8)
+    _ID_COUNTER = itertools.count().__next__
+
+
+# forked children must not continue with the parent's prefix/counter
+os.register_at_fork(after_in_child=_reseed_id_prefix)
+
+
+def _new_task_id() -> TaskId:
+    return _ID_PREFIX + '%016x' % _ID_COUNTER()
+
+
 class Broccoli(App):
 
     conf = None   # type: typing.Dict[str, typing.Any]
@@ -24,6 +50,11 @@ class Broccoli(App):
         else:
             config = kwargs
         self.conf = config
+        if config.get('eager_resolve', True):
+            # resolve broker/router/task_class up front so the first
+            # dispatch doesn't pay the import cost
+            self._bind_hot_methods()
+            self.task_class
 
     def get_applied_conf(self):
         return {
@@ -49,21 +80,21 @@ class Broccoli(App):
         task_class = self.conf.get('task_class', 'Task')
         return load_class(task_class, 'broccoli.task', subclass_of=Task)
 
-    @cached_property
-    def _put_task_req(self):
-        return self.broker.put_task_req
-
-    @cached_property
-    def _put_result(self):
-        return self.broker.put_result
-
-    @cached_property
-    def _get_result(self):
-        return self.broker.get_result
-
-    @cached_property
-    def _get_queue(self):
-        return self.router.get_queue
+    _hot_methods_bound = False
+
+    def _bind_hot_methods(self):
+        # Store bound broker/router methods as plain instance
+        # attributes, so the dispatch hot path pays a single dict probe
+        # per call instead of a descriptor __get__.
+        broker = self.broker
+        self._put_task_req = broker.put_task_req
+        self._put_task_reqs = broker.put_task_reqs
+        self._put_result = broker.put_result
+        self._get_result = broker.get_result
+        self._get_queue = self.router.get_queue
+        self.get_task = broker.get_task_req
+        self.get_tasks = broker.get_task_reqs
+        self._hot_methods_bound = True
 
     def task(self, *args, **kwargs):
         def create_task(fun):
@@ -80,7 +111,9 @@ class Broccoli(App):
         return create_task
 
     def _create_task(self, fun, name=None, base=None, **opts):
-        name = name or '%s.%s' % (fun.__module__, fun.__name__)
+        # interned names make the self.tasks lookups on the dispatch
+        # path pointer-compare hits
+        name = sys.intern(name or '%s.%s' % (fun.__module__, fun.__name__))
         base = base or self.task_class
         namespace = dict({
             'app': self,
@@ -89,31 +122,92 @@ class Broccoli(App):
             '__module__': fun.__module__,
             '__doc__': fun.__doc__
             }, **opts)
+        if hasattr(base, '__slots__'):
+            # keep instances dict-free when the base class opted into
+            # slots; custom bases declare their own slots
+            namespace.setdefault('__slots__', ())
+            # options like expires/time_limit must not shadow the slot
+            # descriptor of the same name (that would make the field
+            # read-only for per-call request values); serve them as
+            # per-class defaults instead
+            shadowing = {k: namespace.pop(k) for k in list(namespace)
+                         if isinstance(getattr(base, k, None),
+                                       types.MemberDescriptorType)}
+            if shadowing:
+                namespace['defaults'] = dict(
+                    getattr(base, 'defaults', None) or {}, **shadowing)
         task = type(fun.__name__, (base,), namespace)
+        task.send = staticmethod(self._make_task_sender(name))
         self.tasks[name] = task
         return task
 
+    def _make_task_sender(self, name):
+        # Compile a dispatch function specialized for one task: queue
+        # and name are baked in as constants and the broker method is a
+        # local, so `MyTask.send(args, kwargs)` skips the routing and
+        # attribute lookups `send_task` pays on every call.
+        if not self._hot_methods_bound:
+            self._bind_hot_methods()
+        queue = self._get_queue(name)
+        ns = {'_put': self._put_task_req, '_new_task_id': _new_task_id}
+        src = (
+            "def send(args=(), kwargs=None, queue=%r, **request):\n"
+            "    task_id = _new_task_id()\n"
+            "    request['queue'] = queue\n"
+            "    request['id'] = task_id\n"
+            "    _put(queue, (%r, request, args, kwargs or {}))\n"
+            "    return task_id\n" % (queue, name))
+        exec(src, ns)
+        return ns['send']
+
     def send_task(self,
                   task_name: str,
                   args: Args,
                   kwargs: Kwargs,
                   queue: QueueName=None,
                   **request) -> TaskId:
-        task_id = uuid4().hex
+        if not self._hot_methods_bound:
+            self._bind_hot_methods()
+        task_name = sys.intern(task_name)
+        task_id = _new_task_id()
         queue = queue or self._get_queue(task_name)
         request['queue'] = queue
         request['id'] = task_id
         self._put_task_req(queue, (task_name, request, args, kwargs))
         return task_id
 
+    def send_task_many(self,
+                       task_name: str,
+                       calls: typing.List[typing.Tuple[Args, Kwargs]],
+                       queue: QueueName=None,
+                       **request) -> typing.List[TaskId]:
+        if not self._hot_methods_bound:
+            self._bind_hot_methods()
+        queue = queue or self._get_queue(task_name)
+        task_ids = []
+        reqs = []
+        for args, kwargs in calls:
+            task_id = _new_task_id()
+            req = dict(request, queue=queue, id=task_id)
+            reqs.append((task_name, req, args, kwargs))
+            task_ids.append(task_id)
+        self._put_task_reqs(queue, reqs)
+        return task_ids
+
     @cached_property
     def get_task(self):
         return self.broker.get_task_req
 
+    @cached_property
+    def get_tasks(self):
+        return self.broker.get_task_reqs
+
     def get_result(self,
                    task_id: TaskId,
                    timeout: float=0,
                    raise_exception: bool=True) -> typing.Any:
+        if not self._hot_methods_bound:
+            self._bind_hot_methods()
         ret = self._get_result(task_id, timeout)
         if ret is None:
             raise TimedOut(task_id)
@@ -129,4 +223,6 @@ class Broccoli(App):
                    task_id: TaskId,
                    value: typing.Any=None,
                    exc: Exception=None) -> None:
+        if not self._hot_methods_bound:
+            self._bind_hot_methods()
         self._put_result(task_id, (value, exc))
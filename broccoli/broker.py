@@ -1,4 +1,11 @@
+from __future__ import annotations
+import io
+import time
 import typing
+import pickle
+from zlib import compress, decompress
+from struct import pack, unpack_from
+from functools import partial
 from . interfaces import Broker
 from . types import QueueName, TaskId
 from . utils import cached_property
@@ -10,21 +17,135 @@ __all__ = (
     )
 
 
+# Minimum batch size worth the pipeline wrapper; smaller batches go
+# through plain RPUSH calls.
+_PIPE_THRESHOLD = 2
+
+# redis-py encodes str keys to bytes on every command; precomputed
+# bytes prefixes skip that per-call work.
+_QUEUE_PREFIX = b'queue.'
+_RESULT_PREFIX = b'result.'
+
+# How often get_result re-polls a pending result key.
+_RESULT_POLL_INTERVAL = 0.05
+
+# Upper bound on a single park on the keyspace-notification socket in
+# get_task_reqs_nb; a missed notification is recovered by re-polling
+# the queues at this interval.
+_NB_RECHECK_INTERVAL = 1.0
+
+# Every payload starts with a one-byte type tag:
+#   0x00 - msgpack
+#   0x01 - framed pickle (protocol 5, out-of-band buffers)
+#   0x02 - orjson
+#   0x78 - zlib-compressed msgpack/orjson payload (zlib magic)
+# The pickle frame compresses only its main stream, since out-of-band
+# buffers are usually binary already; a compressed main stream is
+# likewise recognized by the 0x78 byte.
+#
+# The codec lives in module-level functions with hot globals bound as
+# default args, so per-call access is LOAD_FAST instead of closure-cell
+# dereferences; _get_encoder only binds the configuration via partial.
+_PICKLE_PROTOCOL = 5
+
+
+def _frame(main, buffers, *, _pack=pack):
+    parts = [b'\x01', _pack('>I', len(main)), main]
+    for buf in buffers:
+        buf = bytes(buf)
+        parts.append(_pack('>I', len(buf)))
+        parts.append(buf)
+    return b''.join(parts)
+
+
+def _unframe(data, *, _unpack_from=unpack_from):
+    size, = _unpack_from('>I', data, 1)
+    main = data[5:5 + size]
+    offset = 5 + size
+    buffers = []
+    while offset < len(data):
+        size, = _unpack_from('>I', data, offset)
+        offset += 4
+        buffers.append(data[offset:offset + size])
+        offset += size
+    return main, buffers
+
+
+def _dumps_pickle(data, gzip_min_length=0, *,
+                  _Pickler=pickle.Pickler, _compress=compress):
+    buffers = []
+    buf = io.BytesIO()
+    _Pickler(buf, _PICKLE_PROTOCOL,
+             buffer_callback=buffers.append).dump(data)
+    # getbuffer avoids the getvalue() copy; the size gate and
+    # compressor both work on the view directly
+    main = buf.getbuffer()
+    if gzip_min_length and len(main) >= gzip_min_length:
+        main = _compress(main, 1)
+    return _frame(main, buffers)
+
+
+def _dumps_tagged(data, pack_body=None, gzip_min_length=0, *,
+                  _compress=compress):
+    try:
+        body = pack_body(data)
+    except TypeError:
+        return _dumps_pickle(data, gzip_min_length)
+    if gzip_min_length and len(body) >= gzip_min_length:
+        body = _compress(body, 1)
+    return body
+
+
+def _loads(data, *, _decompress=decompress, _pickle_loads=pickle.loads):
+    tag = data[0]
+    if tag == 0x78:
+        data = _decompress(data)
+        tag = data[0]
+    # slicing a memoryview is copy-free; bytes are only materialized
+    # where the decoder requires them
+    data = memoryview(data)
+    if tag == 0x01:
+        main, buffers = _unframe(data)
+        if main[0] == 0x78:
+            main = _decompress(main)
+        return _pickle_loads(main, buffers=buffers)
+    if tag == 0x00:
+        import msgpack
+        return msgpack.unpackb(data[1:], raw=False)
+    if tag == 0x02:
+        import orjson
+        return orjson.loads(data[1:])
+    raise ValueError('unknown payload tag: %r' % tag)
+
+
 class RedisBroker(Broker):
 
     def __init__(self, *,
                  broker_url: str='redis://',
                  result_expires: int=3600,
                  gzip_min_length: int=0,
+                 use_list_results: bool=False,
+                 serializer: str='pickle',
+                 max_connections: int=32,
                  **kwargs) -> None:
         self.broker_url = broker_url
         self.result_expires = int(result_expires)
         self.gzip_min_length = int(gzip_min_length)
+        self.use_list_results = bool(use_list_results)
+        self.serializer = serializer
+        self.max_connections = int(max_connections)
+        if self.max_connections <= 0:
+            raise ValueError("`max_connections` has invalid value")
         if self.result_expires <= 0:
             raise ValueError("`result_expires` has invalid value")
         if self.gzip_min_length < 0:
             raise ValueError("`gzip_min_length` has invalid value")
-        self._dumps, self._loads = self._get_encoder(self.gzip_min_length)
+        if self.serializer not in ('pickle', 'msgpack', 'orjson'):
+            raise ValueError("`serializer` has invalid value")
+        self._dumps, self._loads = self._get_encoder(self.gzip_min_length,
+                                                     self.serializer)
+        self._queue_key_cache = {}   # type: typing.Dict[QueueName, bytes]
+        self._queue_keys_cache = {}  # type: typing.Dict[tuple, typing.List[bytes]]
 
     def get_applied_conf(self):
         ret = {
@@ -33,78 +154,261 @@ class RedisBroker(Broker):
         }
         if self.gzip_min_length:
             ret['gzip_min_length'] = self.gzip_min_length
+        if self.use_list_results:
+            ret['use_list_results'] = self.use_list_results
+        if self.serializer != 'pickle':
+            ret['serializer'] = self.serializer
         return ret
 
     @cached_property
-    def redis(self):
+    def redis_nb(self):
+        # Pool for short non-blocking commands (RPUSH/SET/GETDEL/...);
+        # bounded so a burst of producers queues up instead of opening
+        # sockets without limit.
+        import redis
+        pool = redis.BlockingConnectionPool.from_url(
+            self.broker_url, max_connections=self.max_connections)
+        return redis.StrictRedis(connection_pool=pool)
+
+    @cached_property
+    def redis_block(self):
+        # Separate pool for BRPOP/BLMPOP and pubsub: blocking calls
+        # hold their connection for the whole wait window and must not
+        # starve the fast path above.
         import redis
         return redis.StrictRedis.from_url(self.broker_url)
 
+    @property
+    def redis(self):
+        return self.redis_nb
+
     @cached_property
     def errors(self):
         import redis.exceptions
         return redis.exceptions.ConnectionError
 
     def put_task_req(self, queue: QueueName, req: typing.Any) -> None:
+        self.put_task_reqs(queue, [req])
+
+    def _queue_key(self, queue: QueueName) -> bytes:
+        key = self._queue_key_cache.get(queue)
+        if key is None:
+            key = self._queue_key_cache.setdefault(
+                queue, _QUEUE_PREFIX + queue.encode())
+        return key
+
+    def _queue_keys(self,
+                    queues: typing.List[QueueName]) -> typing.List[bytes]:
+        qs = tuple(queues)
+        keys = self._queue_keys_cache.get(qs)
+        if keys is None:
+            keys = self._queue_keys_cache.setdefault(
+                qs, [self._queue_key(q) for q in queues])
+        return keys
+
+    def put_task_reqs(self,
+                      queue: QueueName,
+                      reqs: typing.List[typing.Any]) -> None:
+        key = self._queue_key(queue)
+        dumps = self._dumps
         try:
-            self.redis.rpush('queue.' + queue, self._dumps(req))
+            if len(reqs) < _PIPE_THRESHOLD:
+                for req in reqs:
+                    self.redis.rpush(key, dumps(req))
+            else:
+                pipe = self.redis.pipeline(transaction=False)
+                for req in reqs:
+                    pipe.rpush(key, dumps(req))
+                pipe.execute()
         except self.errors as e:
             raise BrokerError(str(e)) from None
 
+    @cached_property
+    def _server_version(self):
+        # INFO is often disabled or renamed on managed servers; an
+        # unknown version only disables GETDEL/BLMPOP, so the probe
+        # must never let an error escape into the hot path.
+        import redis.exceptions
+        try:
+            version = self.redis.info('server').get('redis_version', '0')
+        except redis.exceptions.RedisError:
+            return 0, 0
+        parts = version.split('.')
+        try:
+            return int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+        except (ValueError, TypeError):
+            return 0, 0
+
+    @cached_property
+    def _has_blmpop(self):
+        # BLMPOP appeared in Redis 7.0.
+        return self._server_version >= (7, 0)
+
+    @cached_property
+    def _has_getdel(self):
+        # GETDEL appeared in Redis 6.2.
+        return self._server_version >= (6, 2)
+
     def get_task_req(self,
                      queues: typing.List[QueueName],
                      timeout: float=0) -> typing.Any:
-        queues = ['queue.' + q for q in queues]
+        reqs = self.get_task_reqs(queues, timeout)
+        if reqs is not None:
+            return reqs[0]
+        return None
+
+    def get_task_reqs(self,
+                      queues: typing.List[QueueName],
+                      timeout: float=0,
+                      count: int=1) -> typing.Any:
+        keys = self._queue_keys(queues)
         try:
-            req = self.redis.brpop(queues, timeout)
+            if count > 1 and self._has_blmpop:
+                ret = self.redis_block.execute_command(
+                    'BLMPOP', timeout, len(keys), *keys,
+                    'RIGHT', 'COUNT', count)
+                if ret is not None:
+                    return [self._loads(item) for item in ret[1]]
+                return None
+            req = self.redis_block.brpop(keys, timeout)
         except self.errors as e:
             raise BrokerError(str(e)) from None
         if req is not None:
-            return self._loads(req[1])
+            return [self._loads(req[1])]
         return None
 
+    @cached_property
+    def _queue_events(self):
+        # One pubsub connection watching queue key activity; requires
+        # the server to have keyspace notifications enabled for list
+        # ops (notify-keyspace-events including 'Kl'). Fail loudly
+        # when the server says they are off — they are off by default,
+        # and waiting on a socket that can never fire looks like a
+        # hang. Managed servers that refuse CONFIG GET get the benefit
+        # of the doubt; the re-poll loop recovers regardless.
+        import redis.exceptions
+        try:
+            conf = self.redis.config_get('notify-keyspace-events')
+        except redis.exceptions.RedisError:
+            conf = None
+        if conf is not None:
+            flags = conf.get('notify-keyspace-events', '')
+            if 'K' not in flags or ('l' not in flags and 'A' not in flags):
+                raise BrokerError(
+                    "keyspace notifications are disabled on the server; "
+                    "set notify-keyspace-events to include 'Kl' to use "
+                    "get_task_reqs_nb")
+        pubsub = self.redis_block.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe('__keyspace@*__:queue.*')
+        return pubsub
+
+    def get_task_reqs_nb(self,
+                         queues: typing.List[QueueName],
+                         timeout: float=0,
+                         count: int=1) -> typing.Any:
+        """
+        Non-blocking variant of `get_task_reqs`: pop via LMPOP and,
+        when every queue is empty, park on the keyspace-notification
+        socket instead of holding the main connection in a blocking
+        pop. Returns None when nothing arrived within `timeout`; as
+        with `get_task_reqs`, a timeout of 0 means wait without limit.
+
+        Nothing in-tree calls this: the prefork worker uses the
+        blocking variant. It is public API for custom consumers that
+        multiplex many queues over few connections.
+        """
+        keys = self._queue_keys(queues)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            events = self._queue_events
+            while 1:
+                if self._has_blmpop:
+                    ret = self.redis.execute_command(
+                        'LMPOP', len(keys), *keys, 'RIGHT', 'COUNT', count)
+                    if ret is not None:
+                        return [self._loads(item) for item in ret[1]]
+                else:
+                    for key in keys:
+                        item = self.redis.rpop(key)
+                        if item is not None:
+                            return [self._loads(item)]
+                # park at most _NB_RECHECK_INTERVAL so a dropped
+                # notification degrades to slow polling, never a hang
+                wait = _NB_RECHECK_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    if remaining < wait:
+                        wait = remaining
+                events.get_message(timeout=wait)
+        except self.errors as e:
+            raise BrokerError(str(e)) from None
+
     def put_result(self, task_id: TaskId, value: typing.Any) -> None:
         value = self._dumps(value)
-        key = 'result.%s' % task_id
+        key = _RESULT_PREFIX + task_id.encode('ascii')
         try:
-            (self.redis.pipeline()
-                       .rpush(key, value)
-                       .expire(key, self.result_expires)
-                       .execute())
+            if self.use_list_results:
+                (self.redis.pipeline()
+                           .rpush(key, value)
+                           .expire(key, self.result_expires)
+                           .execute())
+            else:
+                self.redis.set(key, value, ex=self.result_expires)
         except self.errors as e:
             raise BrokerError(str(e)) from None
 
     def get_result(self, task_id: TaskId, timeout: float=0) -> typing.Any:
+        key = _RESULT_PREFIX + task_id.encode('ascii')
         try:
-            ret = self.redis.brpop('result.%s' % task_id, timeout)
+            if self.use_list_results:
+                ret = self.redis_block.brpop(key, timeout)
+                if ret is not None:
+                    return self._loads(ret[1])
+                return None
+            deadline = time.monotonic() + timeout if timeout else None
+            has_getdel = self._has_getdel
+            while 1:
+                if has_getdel:
+                    ret = self.redis.execute_command('GETDEL', key)
+                else:
+                    # pre-6.2 servers: transactional GET+DEL is the
+                    # same read-and-consume in one round trip
+                    ret, _ = (self.redis.pipeline()
+                                  .get(key)
+                                  .delete(key)
+                                  .execute())
+                if ret is not None:
+                    return self._loads(ret)
+                if deadline is None:
+                    time.sleep(_RESULT_POLL_INTERVAL)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                time.sleep(min(_RESULT_POLL_INTERVAL, remaining))
         except self.errors as e:
             raise BrokerError(str(e)) from None
-        if ret is not None:
-            return self._loads(ret[1])
-        return None
 
-    def _get_encoder(self, gzip_min_length):
-        import pickle
-        _dumps = pickle.dumps
-        _loads = pickle.loads
-        if gzip_min_length > 0:
-            from gzip import compress, decompress
-
-            def loads(data):
-                if data[0] == 0x1f:
-                    data = decompress(data)
-                return _loads(data)
-
-            def dumps(data):
-                data = _dumps(data, 4)
-                if len(data) >= gzip_min_length:
-                    data = compress(data)
-                return data
+    def _get_encoder(self, gzip_min_length, serializer):
+        if serializer == 'pickle':
+            dumps = partial(_dumps_pickle, gzip_min_length=gzip_min_length)
         else:
-            def loads(data):
-                return _loads(data)
+            # msgpack/orjson are 3-5x faster and noticeably smaller for
+            # plain JSON-ish payloads; anything they cannot represent
+            # falls back to pickle. Note both decode tuples as lists.
+            if serializer == 'msgpack':
+                import msgpack
+
+                def pack_body(data, *, _packb=msgpack.packb):
+                    return b'\x00' + _packb(data, use_bin_type=True)
+            else:
+                import orjson
 
-            def dumps(data):
-                return _dumps(data, 4)
+                def pack_body(data, *, _packb=orjson.dumps):
+                    return b'\x02' + _packb(data)
 
-        return dumps, loads
+            dumps = partial(_dumps_tagged, pack_body=pack_body,
+                            gzip_min_length=gzip_min_length)
+        return dumps, _loads
@@ -1,3 +1,4 @@
+from __future__ import annotations
 import abc
 import typing
 from . types import QueueName, TaskId
@@ -36,6 +37,10 @@ class Logger(metaclass=abc.ABCMeta):
 
 class Result(metaclass=abc.ABCMeta):
 
+    # empty slots keep concrete results dict-free; implementations
+    # declare their own fields
+    __slots__ = ()
+
     @abc.abstractmethod
     def __init__(self, app: 'App', task_id: TaskId) -> None:
         raise NotImplementedError
@@ -51,6 +56,8 @@ class Result(metaclass=abc.ABCMeta):
 
 class Task(metaclass=abc.ABCMeta):
 
+    __slots__ = ()
+
     @abc.abstractmethod
     def __init__(self, request: Kwargs) -> None:
         raise NotImplementedError
@@ -106,6 +113,14 @@ class App(Configurable):
                   **request) -> TaskId:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def send_task_many(self,
+                       task_name: str,
+                       calls: typing.List[typing.Tuple[Args, Kwargs]],
+                       queue: QueueName=None,
+                       **request) -> typing.List[TaskId]:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_task(self,
                  queues: typing.List[QueueName],
@@ -119,12 +134,25 @@ class Broker(Configurable):
     def put_task_req(self, queue: QueueName, req: typing.Any) -> None:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def put_task_reqs(self,
+                      queue: QueueName,
+                      reqs: typing.List[typing.Any]) -> None:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_task_req(self,
                      queues: typing.List[QueueName],
                      timeout: float=0) -> typing.Any:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_task_reqs(self,
+                      queues: typing.List[QueueName],
+                      timeout: float=0,
+                      count: int=1) -> typing.Any:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def put_result(self, task_id: TaskId, value: typing.Any) -> None:
         raise NotImplementedError
@@ -155,6 +183,12 @@ class Worker(Configurable):
 
 class Plugin(Configurable):
 
+    # When True the master may fuse task_start and task_done into one
+    # task_complete event, in which case task_start handlers run at
+    # task completion. Plugins that must see the start while the task
+    # is still running set this to False.
+    coalesce_task_events = True
+
     @classmethod
     def add_console_args(cls, parser) -> None:
         pass
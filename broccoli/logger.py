@@ -1,3 +1,4 @@
+from __future__ import annotations
 import time
 import logging
 from . interfaces import Logger
@@ -14,41 +15,38 @@ class ConsoleLogger(Logger):
     def __init__(self, name) -> None:
         self.name = name
         self.colorize = get_colorizer()
-        self.format = self.get_format()
         self.level = logging.DEBUG
 
-    def get_format(self):
-        def format(level, text):
-            return '%.3f - %s - %s' % (
-                time.time(), level, text)
-        return format
-
     def debug(self, msg, *args) -> None:
+        if self.level > logging.DEBUG:
+            return
         msg = msg % args if args else msg
-        print(self.colorize(self.format('DEBUG', msg),
+        print(self.colorize(f'{time.time():.3f} - DEBUG - {msg}',
                             self.debug_color))
 
     def info(self, msg, *args) -> None:
+        if self.level > logging.INFO:
+            return
         msg = msg % args if args else msg
-        print(self.colorize(self.format('INFO', msg),
+        print(self.colorize(f'{time.time():.3f} - INFO - {msg}',
                             self.info_color))
 
     def warning(self, msg, *args) -> None:
+        if self.level > logging.WARNING:
+            return
         msg = msg % args if args else msg
-        print(self.colorize(self.format('WARNING', msg),
+        print(self.colorize(f'{time.time():.3f} - WARNING - {msg}',
                             self.warning_color))
 
     def error(self, msg, *args) -> None:
+        if self.level > logging.ERROR:
+            return
         msg = msg % args if args else msg
-        print(self.colorize(self.format('ERROR', msg),
+        print(self.colorize(f'{time.time():.3f} - ERROR - {msg}',
                             self.error_color))
 
     def setLevel(self, level: int) -> None:
-        def _unlogged(msg, *args):
-            pass
-        for lvl in ('debug', 'info', 'warning', 'error'):
-            if level > logging._nameToLevel[lvl.upper()]:
-                setattr(self, lvl, _unlogged)
-            else:
-                self.__dict__.pop(lvl, None)
+        # the logging methods check self.level up front, so disabling
+        # a level is a plain attribute store instead of swapping
+        # per-instance method closures in and out
         self.level = level
@@ -1,6 +1,8 @@
+from __future__ import annotations
 import os
 import argparse
 import logging
+from itertools import groupby
 from . logger import ConsoleLogger
 from . utils import load_instance, load_class, fullclassname
 from . utils import get_colorizer, color
@@ -230,11 +232,20 @@ def print_startup_info(*args):
             0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
     ]
 
+    def render_row(row):
+        # one escape sequence per run of equally-colored cells instead
+        # of one per cell
+        out = []
+        for clr, run in groupby(row,
+                                key=lambda c:
+                                c if type(c) is int else color.grey):
+            chars = ''.join(' ' if c == 0 else (c if type(c) is str else '#')
+                            for c in run)
+            out.append(colorize(chars, clr))
+        return ''.join(out)
+
     if colorize.support_colors:
-        lines = [[len(line), (''.join([colorize(
-                    ' ' if c == 0 else (c if type(c) is str else '#'),
-                    c if type(c) is int else color.grey
-                 ) for c in line]))] for line in lines]
+        lines = [[len(row), render_row(row)] for row in lines]
     else:
         lines = []
 
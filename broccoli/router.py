@@ -1,4 +1,5 @@
 import typing
+from collections import defaultdict
 from . interfaces import Router
 from . types import QueueName
 
@@ -16,6 +17,11 @@ class DefaultRouter(Router):
                  **kwargs) -> None:
         self.task_routes = task_routes or {}
         self.default_queue = default_queue
+        # shadow the method with a defaultdict lookup bound on the
+        # instance: routing is then a single C-level dict hit with no
+        # attribute loads on self
+        table = defaultdict(lambda: default_queue, self.task_routes)
+        self.get_queue = table.__getitem__
 
     def get_queue(self, task_name: str) -> QueueName:
         return self.task_routes.get(task_name, self.default_queue)
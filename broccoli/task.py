@@ -14,31 +14,71 @@ class Status:
     DONE = 'done'
 
 
-class Task(AbstractTask):
-
+# Fallbacks for request fields that were not sent with the task. Every
+# per-call-overridable option lives here rather than as a class
+# attribute: its name is taken by a slot below, and a class attribute
+# of the same name would shadow the slot descriptor and make the field
+# read-only for request values. Task options that would shadow a slot
+# are merged into a per-class copy of this mapping instead (see
+# `Broccoli._create_task`).
+_TASK_DEFAULTS = {
+    # Default task expiry time.
+    'expires': None,
+    # Time limit.
+    'time_limit': None,
     # Tuple of expected exceptions.
     #
     # These are errors that are expected in normal operation
     # and that shouldn't be regarded as a real error by the worker.
-    throws = ()
-
-    # Default task expiry time.
-    expires = None
+    'throws': (),
+    # Maximum number of retries before giving up.
+    'max_retries': 3,
+    # Default time in seconds before a retry of the task should be
+    # executed.
+    'default_retry_delay': 3 * 60,
+    # Retry a task whenever a particular exception is raised
+    'autoretry_for': (),
+    # Catch-all for request fields without a slot of their own.
+    'extra': None,
+}
 
-    # Time limit.
-    time_limit = None
 
-    # Maximum number of retries before giving up.
-    max_retries = 3
+class Task(AbstractTask):
 
-    # Default time in seconds before a retry of the task should be executed.
-    default_retry_delay = 3 * 60
+    # One slot per known request field; the request no longer becomes
+    # the instance dict, so task instances carry no dict at all and
+    # attribute reads skip the dict lookup. Fields the slots don't
+    # know about land in the `extra` dict.
+    __slots__ = ('queue', 'id', 'expires', 'time_limit', 'retries',
+                 'headers', 'throws', 'max_retries',
+                 'default_retry_delay', 'autoretry_for', 'extra')
 
-    # Retry a task whenever a particular exception is raised
-    autoretry_for = ()
+    defaults = _TASK_DEFAULTS
 
     def __init__(self, request: Kwargs) -> None:
-        self.__dict__ = request
+        extra = None
+        for k, v in request.items():
+            try:
+                setattr(self, k, v)
+            except AttributeError:
+                # request fields may carry anything; keys without a
+                # slot go to the catch-all dict
+                if extra is None:
+                    extra = {}
+                extra[k] = v
+        if extra is not None:
+            self.extra = extra
+
+    def __getattr__(self, name):
+        # only reached when a slot was never filled from the request
+        try:
+            return self.defaults[name]
+        except KeyError:
+            pass
+        extra = self.extra
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError(name) from None
 
     def __call__(self, *args, **kwargs):
         return self.run(*args, **kwargs)
@@ -2,20 +2,44 @@ import os
 import sys
 import typing
 import importlib
+# re-exported: the rest of the package imports cached_property from here
+from functools import lru_cache, cached_property  # noqa: F401
+
+
+def _import_module(name: str) -> typing.Any:
+    # already-imported modules resolve with a dict lookup instead of
+    # going through the import machinery and its lock
+    module = sys.modules.get(name)
+    if module is None:
+        module = importlib.import_module(name)
+    return module
 
 
 def load_string(path: str, module: typing.Any=None) -> typing.Any:
+    if module is None or isinstance(module, str):
+        # the common call shape is fully described by two strings;
+        # lru_cache only keeps successful lookups
+        return _load_string_cached(path, module)
+    return _load_string(path, module)
+
+
+@lru_cache(maxsize=1024)
+def _load_string_cached(path: str, module: typing.Any) -> typing.Any:
+    return _load_string(path, module)
+
+
+def _load_string(path: str, module: typing.Any) -> typing.Any:
     if '.' in path:
         module, attr = path.rsplit('.', 1)
         try:
-            module = importlib.import_module(module)
+            module = _import_module(module)
         except Exception as e:
             raise ImportError(path) from e
         path = attr
 
     if isinstance(module, str):
         try:
-            module = importlib.import_module(module)
+            module = _import_module(module)
         except Exception as e:
             raise ImportError(path) from e
 
@@ -28,9 +52,36 @@ def load_string(path: str, module: typing.Any=None) -> typing.Any:
         raise ImportError(path)
 
 
+# Resolved (path, module, subclass_of) triples; repeated lookups of the
+# same class skip the import machinery entirely.
+_CLASS_CACHE = {}  # type: typing.Dict[tuple, type]
+
+# issubclass on ABCMeta bases goes through __subclasshook__ and its
+# negative cache; memoize results so probing the same class against the
+# same base is a dict hit. Classes live for the process lifetime here,
+# so strong references are fine.
+_SUBCLASS_CACHE = {}  # type: typing.Dict[tuple, bool]
+
+
+def _is_subclass(cls: type, base: type) -> bool:
+    key = (cls, base)
+    ret = _SUBCLASS_CACHE.get(key)
+    if ret is None:
+        ret = _SUBCLASS_CACHE[key] = issubclass(cls, base)
+    return ret
+
+
 def load_class(path: typing.Any,
                module: typing.Any=None,
                subclass_of: typing.Type=None) -> typing.Type:
+    if isinstance(path, str) and (module is None or isinstance(module, str)):
+        key = (path, module, subclass_of)
+        cached = _CLASS_CACHE.get(key)
+        if cached is not None:
+            return cached
+    else:
+        key = None
+
     if isinstance(path, str):
         ret = load_string(path, module)
     else:
@@ -39,9 +90,11 @@ def load_class(path: typing.Any,
     if not isinstance(ret, type):
         raise TypeError('%r is not a class.' % ret)
 
-    if subclass_of and not issubclass(ret, subclass_of):
+    if subclass_of and not _is_subclass(ret, subclass_of):
         raise TypeError('%r is not subclass of %r.' % (ret, subclass_of))
 
+    if key is not None:
+        _CLASS_CACHE[key] = ret
     return ret
 
 
@@ -54,7 +107,7 @@ def load_instance(path: typing.Any,
     else:
         ret = path
 
-    if instance_of and not isinstance(ret, instance_of):
+    if instance_of and not _is_subclass(type(ret), instance_of):
         raise TypeError('%r is not instance of %r.' % (ret, instance_of))
 
     return ret
@@ -68,30 +121,6 @@ def fullclassname(cls):
     return '%s.%s' % (cls.__module__, cls.__name__)
 
 
-class cached_property:
-    """
-    Decorator that converts a method with a single self argument into a
-    property cached on the instance.
-    Optional ``name`` argument allows you to make cached properties of other
-    methods. (e.g.  url = cached_property(get_absolute_url, name='url') )
-    """
-    def __init__(self, func, name=None):
-        self.func = func
-        self.__doc__ = getattr(func, '__doc__')
-        self.name = name or func.__name__
-
-    def __get__(self, instance, cls=None):
-        """
-        Call the function and put the return value in instance.__dict__ so that
-        subsequent attribute access on the instance returns the cached value
-        instead of calling cached_property.__get__().
-        """
-        if instance is None:
-            return self
-        res = instance.__dict__[self.name] = self.func(instance)
-        return res
-
-
 class color:
     black = 0
     maroon = 1
@@ -124,32 +153,14 @@ def _fake_colorizer(text, color):
 _fake_colorizer.support_colors = False  # type: ignore
 
 
-def _simple_colorizer(text, color):
-    return '\x1b[38;5;%dm%s\x1b[0m' % (color, text)
+# One escape-sequence prefix per 256-color code, built once at import;
+# colorizing is then two concatenations instead of a % format.
+_ANSI_PREFIX = tuple('\x1b[38;5;%dm' % i for i in range(256))
+_ANSI_SUFFIX = '\x1b[0m'
 
 
-_simple_colorizer.support_colors = True  # type: ignore
+def _simple_colorizer(text, color):
+    return _ANSI_PREFIX[color] + text + _ANSI_SUFFIX
 
 
-def reiter(v, seq):
-    yield v
-    yield from seq
-
-
-def rewind(vals, chains):
-    if not chains or not vals:
-        return False, ()
-    val, *rest_vals = vals
-    chain, *rest_chains = chains
-    chain = iter(chain)
-    for v in chain:
-        if v > val:
-            return False, (reiter(v, chain), *rest_chains)
-        elif v == val:
-            restarted, rest_chains = rewind(rest_vals, rest_chains)
-            return False, (
-                chain if restarted else reiter(v, chain),
-                *rest_chains
-                )
-    else:
-        return True, chains
+_simple_colorizer.support_colors = True  # type: ignore
@@ -1,12 +1,22 @@
 import os
 import sys
 import time
+import errno
 import typing
 import logging
+import random
 import signal
+import select
+import socket
+import pickle
 import traceback
+import selectors
 import multiprocessing as mp
-from multiprocessing.connection import wait
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
 from . exceptions import TaskInterrupt, WorkerInterrupt, BrokerError
 from . exceptions import WarmShutdown, ColdShutdown
 from . interfaces import App, Worker, Plugin, Logger
@@ -14,6 +24,66 @@ from . types import QueueName
 from . utils import cached_property
 
 
+# Event batches cross the pipe as one tagged frame: 0x02 orjson for the
+# usual primitive payloads (several times faster than pickle for small
+# dicts), 0x01 pickle when a payload carries something JSON cannot, or
+# when orjson is not installed. Exceptions are rendered to repr strings
+# before packing, so they never force the pickle path.
+def _pack_events(batch):
+    if orjson is not None:
+        try:
+            return b'\x02' + orjson.dumps(batch)
+        except TypeError:
+            pass
+    return b'\x01' + pickle.dumps(batch, 5)
+
+
+def _unpack_events(data):
+    if data[0] == 0x02:
+        return orjson.loads(data[1:])
+    return pickle.loads(data[1:])
+
+
+# First retry delay after a BrokerError, in seconds; doubles per
+# consecutive failure up to error_timeout.
+_BACKOFF_BASE = 0.5
+
+# send() errnos meaning the master end of the event channel is gone
+# for good; an orphaned worker must stop instead of retrying forever.
+_CONN_LOST_ERRNOS = frozenset((errno.ECONNREFUSED, errno.ECONNRESET,
+                               errno.EPIPE))
+
+
+class _EventChannel:
+    """
+    One half of a datagram socketpair. Every event batch is a single
+    atomic datagram, so the stream framing of multiprocessing.Pipe
+    (4-byte length prefix, two reads per message) goes away: one
+    syscall to send, one to receive.
+    """
+
+    __slots__ = ('sock', 'proc', 'pid')
+
+    _BUF_SIZE = 1 << 20
+
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._BUF_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._BUF_SIZE)
+
+    def send_bytes(self, data):
+        self.sock.send(data)
+
+    def recv_bytes(self):
+        return self.sock.recv(self._BUF_SIZE)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
 class Prefork(Worker):
 
     @classmethod
@@ -38,6 +108,18 @@ class Prefork(Worker):
                             type=float,
                             default=0,
                             help='Timeout after error.')
+        parser.add_argument('--fetch_count',
+                            dest='fetch_count',
+                            type=int,
+                            default=1,
+                            help='Number of task requests fetched per '
+                                 'broker round trip.')
+        parser.add_argument('--mp_start_method',
+                            dest='mp_start_method',
+                            type=str,
+                            default='fork',
+                            help='Multiprocessing start method for workers '
+                                 '(fork, forkserver or spawn).')
 
     def __init__(self, *,
                  app: App,
@@ -45,8 +127,10 @@ class Prefork(Worker):
                  logger: typing.Union[logging.Logger, Logger],
                  error_timeout: float=10,
                  fetch_timeout: float=0,
+                 fetch_count: int=1,
                  queues: typing.List[QueueName]=['default'],
                  plugins: typing.List[Plugin]=[],
+                 mp_start_method: str='fork',
                  **kwargs) -> None:
         self.app = app
         self.queues = queues
@@ -55,24 +139,43 @@ class Prefork(Worker):
         self.concurrency = concurrency
         self.error_timeout = error_timeout
         self.fetch_timeout = fetch_timeout
+        self.fetch_count = fetch_count
         if self.concurrency <= 0:
             self.concurrency = mp.cpu_count()
+        if self.fetch_count <= 0:
+            self.fetch_count = 1
+        # 'forkserver' starts every worker from a small template process
+        # instead of copy-on-write-forking the whole master heap; it is
+        # opt-in because the app and its tasks must then be picklable
+        self.mp_start_method = mp_start_method
+        self._ctx = mp.get_context(mp_start_method)
+        if mp_start_method == 'forkserver':
+            self._ctx.set_forkserver_preload(['broccoli'])
 
     def get_applied_conf(self):
         return {
             'concurrency': self.concurrency,
             'queues': self.queues,
             'error_timeout': self.error_timeout,
-            'fetch_timeout': self.fetch_timeout
+            'fetch_timeout': self.fetch_timeout,
+            'fetch_count': self.fetch_count,
+            'mp_start_method': self.mp_start_method
         }
 
     def start_worker(self):
-        c1, c2 = mp.Pipe()
+        # events only ever flow worker -> master
+        s1, s2 = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        c1, c2 = _EventChannel(s1), _EventChannel(s2)
         events = list(self.plugin_handlers.keys())
-        args = (c2, self.app, self.queues, events,
-                self.error_timeout, self.fetch_timeout)
-        proc = mp.Process(target=self.init_and_run_worker, args=args)
+        # the worker gets the master end too, only to close it: under
+        # the fork start method the child inherits the fd, and a live
+        # copy inside the worker would keep send() succeeding after the
+        # master died, defeating orphan detection in flush()
+        args = (c2, c1, self.app, self.queues, events,
+                self.error_timeout, self.fetch_timeout, self.fetch_count)
+        proc = self._ctx.Process(target=self.init_and_run_worker, args=args)
         proc.start()
+        c2.close()
         c1.proc = proc
         c1.pid = proc.pid
         return c1
@@ -105,17 +208,53 @@ class Prefork(Worker):
                 if e.args and e.args[0] == signal.SIGINT:
                     self.logger.warning('hitting Ctrl+C again will terminate '
                                         'all running tasks!')
-                for w in workers:
-                    os.kill(w.pid, signal.SIGTERM)
-                    w.close()
 
-                while workers:
+                # wake up exactly when a child exits instead of polling
+                # join(1) per worker: SIGCHLD pokes a self-pipe we
+                # sleep on (a socketpair, portable where eventfd is
+                # not). Children are still reaped through proc.join so
+                # multiprocessing keeps its own bookkeeping.
+                wake_r, wake_w = socket.socketpair()
+                wake_r.setblocking(False)
+                wake_w.setblocking(False)
+
+                def child_exit_handler(signum, frame):
+                    try:
+                        wake_w.send(b'\0')
+                    except OSError:
+                        # a full buffer already holds a pending wakeup
+                        pass
+
+                signal.signal(signal.SIGCHLD, child_exit_handler)
+                try:
                     for w in workers:
-                        w.proc.join(1)
-                        if not w.proc.is_alive():
-                            self.logger.warning('worker [%d] gently stopped.',
-                                                w.pid)
-                    workers = [w for w in workers if w.proc.is_alive()]
+                        os.kill(w.pid, signal.SIGTERM)
+                        w.close()
+
+                    while workers:
+                        alive = []
+                        for w in workers:
+                            w.proc.join(0)
+                            if w.proc.is_alive():
+                                alive.append(w)
+                            else:
+                                self.logger.warning(
+                                    'worker [%d] gently stopped.', w.pid)
+                        workers = alive
+                        if not workers:
+                            break
+                        # the handler may have fired between the scan
+                        # and this point; the self-pipe keeps the wakeup
+                        select.select([wake_r], [], [])
+                        try:
+                            while wake_r.recv(512):
+                                pass
+                        except BlockingIOError:
+                            pass
+                finally:
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    wake_r.close()
+                    wake_w.close()
 
         except ColdShutdown:
             for w in workers:
@@ -129,17 +268,28 @@ class Prefork(Worker):
         master_idle = self.master_idle
         get_time = time.time
 
-        while 1:
-            try:
-                timeout = master_idle(get_time())
-                ready = wait(workers, timeout)
-                for w in ready:
-                    event, kwargs = w.recv()
-                    handler = get_handler(event)
-                    if handler is not None:
-                        handler(w, **kwargs)
-            except Exception:
-                self.logger.error(traceback.format_exc())
+        # register the worker channels once; every loop iteration is
+        # then a single epoll_wait instead of connection.wait() building
+        # a fresh poll set over all workers per call
+        sel = selectors.DefaultSelector()
+        for w in workers:
+            sel.register(w, selectors.EVENT_READ)
+        select_ready = sel.select
+
+        try:
+            while 1:
+                try:
+                    timeout = master_idle(get_time())
+                    for key, _ in select_ready(timeout):
+                        w = key.fileobj
+                        for event, kwargs in _unpack_events(w.recv_bytes()):
+                            handler = get_handler(event)
+                            if handler is not None:
+                                handler(w, **kwargs)
+                except Exception:
+                    self.logger.error(traceback.format_exc())
+        finally:
+            sel.close()
 
     @cached_property
     def plugin_handlers(self):
@@ -148,12 +298,17 @@ class Prefork(Worker):
         def make_handler(fun):
             def handler(w, **kwargs):
                 for f in fun:
-                    f(**kwargs)
+                    f(w, **kwargs)
             return handler
 
+        coalesce = True
         for p in self.plugins:
-            for k, v in p.register_master_handlers().items():
+            registered = p.register_master_handlers()
+            for k, v in registered.items():
                 handlers.setdefault(k, []).append(v)
+            if (('task_start' in registered or 'task_done' in registered)
+                    and not getattr(p, 'coalesce_task_events', True)):
+                coalesce = False
 
         for k in handlers:
             v = handlers[k]
@@ -162,6 +317,26 @@ class Prefork(Worker):
             else:
                 handlers[k] = make_handler(v)
 
+        # when every interested plugin tolerates it, advertise a fused
+        # task_complete event: the worker then sends one event per
+        # finished task instead of a start/done pair, and this handler
+        # replays both halves in order
+        if (coalesce and 'task_start' in handlers and 'task_done' in handlers
+                and 'task_complete' not in handlers):
+            start_handler = handlers['task_start']
+            done_handler = handlers['task_done']
+
+            def complete_handler(w, task_name, task_request,
+                                 start_time, running_time):
+                start_handler(w, task_name=task_name,
+                              task_request=task_request,
+                              start_time=start_time)
+                done_handler(w, task_name=task_name,
+                             task_request=task_request,
+                             running_time=running_time)
+
+            handlers['task_complete'] = complete_handler
+
         return handlers
 
     @cached_property
@@ -180,35 +355,40 @@ class Prefork(Worker):
 
         def make_run(fun):
             def handler(ct):
-                return min(
-                    [t for t in [f(ct) for f in fun] if t is not None],
-                    default=None)
+                # running minimum: no intermediate lists on a path that
+                # runs once per master loop iteration
+                best = None
+                for f in fun:
+                    t = f(ct)
+                    if t is not None and (best is None or t < best):
+                        best = t
+                return best
             return handler
         return make_run(handlers)
 
     @staticmethod
     def init_and_run_worker(conn,
+                            master_conn,
                             app: App,
                             queues: typing.List[QueueName],
                             events: typing.List[str],
                             error_timeout: float,
-                            fetch_timeout: float):
-        WORKER_INTERRUPT = 'worker'
-        TASK_INTERRUPT = 'task'
+                            fetch_timeout: float,
+                            fetch_count: int=1):
+        if master_conn is not None:
+            master_conn.close()
+        # interrupt-permission states for the signal handlers below;
+        # compared by identity, and the GIL makes every store and test
+        # atomic with respect to the handlers
+        WORKER_INTERRUPT = 1
+        TASK_INTERRUPT = 2
         can_raise = None
+        # wall clock on purpose: task.expires and the start_time shipped
+        # to the master are wall-clock values. The loop reads it exactly
+        # twice per task — start_time, then once in the single terminal
+        # branch the task takes.
         get_time = time.time
         terminated = False
-        emit_worker_start = 'worker_start' in events
-        emit_worker_error = 'worker_error' in events
-        emit_broker_error = 'broker_error' in events
-        emit_task_unknown = 'task_unknown' in events
-        emit_task_expires = 'task_expires' in events
-        emit_task_start = 'task_start' in events
-        emit_task_interrupt = 'task_interrupt' in events
-        emit_task_exception = 'task_exception' in events
-        emit_task_done = 'task_done' in events
-
-        del events
 
         def task_interrupt_handler(signum, frame):
             nonlocal can_raise
@@ -231,120 +411,268 @@ class Prefork(Worker):
         signal.signal(signal.SIGQUIT, worker_cold_interrupt_handler)
         signal.signal(signal.SIGUSR1, task_interrupt_handler)
 
+        pending = []  # type: typing.List[tuple]
+
         def emit(event, **kwargs):
             if not terminated:
-                conn.send((event, kwargs))
+                pending.append((event, kwargs))
+
+        def flush():
+            # one send per batch instead of one per event
+            if pending:
+                try:
+                    conn.send_bytes(_pack_events(pending))
+                except OSError as e:
+                    if e.errno in _CONN_LOST_ERRNOS:
+                        # the master died: stop instead of spinning on
+                        # a dead socket while pending grows unbounded
+                        raise WorkerInterrupt() from None
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    # batch outgrew a single datagram: fall back to one
+                    # datagram per event, consuming each item as it is
+                    # handled so a failure mid-way never re-sends what
+                    # already went out
+                    while pending:
+                        item = pending[0]
+                        del pending[0]
+                        try:
+                            conn.send_bytes(_pack_events([item]))
+                        except OSError as e:
+                            if e.errno in _CONN_LOST_ERRNOS:
+                                raise WorkerInterrupt() from None
+                            if e.errno != errno.EMSGSIZE:
+                                pending.insert(0, item)
+                                raise
+                            # a single event bigger than the datagram
+                            # limit can never be delivered: drop it
+                            # rather than livelock retrying
+                    return
+                del pending[:]
+
+        def emit_null(event, **kwargs):
+            pass
+
+        # per-event emitters resolved once: the hot path calls them
+        # unconditionally instead of testing a flag before every emit
+        emit_worker_start = emit if 'worker_start' in events else emit_null
+        emit_broker_error = emit if 'broker_error' in events else emit_null
+        emit_task_unknown = emit if 'task_unknown' in events else emit_null
+        emit_task_expires = emit if 'task_expires' in events else emit_null
+        emit_task_start = emit if 'task_start' in events else emit_null
+        emit_task_interrupt = emit if 'task_interrupt' in events else emit_null
+        emit_task_done = emit if 'task_done' in events else emit_null
+        # these two keep boolean guards: their payloads are expensive
+        # to build (traceback.format_exc), so the arguments must not be
+        # evaluated when nobody listens
+        emit_task_exception = 'task_exception' in events
+        emit_worker_error = 'worker_error' in events
+
+        # fused mode: the master registered task_complete, so the
+        # pre-run start event is skipped and its payload travels inside
+        # task_complete — or, on failure paths, as a late task_start
+        # sent right before the failing event
+        fuse_complete = 'task_complete' in events
+        if fuse_complete:
+            emit_pre_start, emit_late_start = emit_null, emit_task_start
+        else:
+            emit_pre_start, emit_late_start = emit_task_start, emit_null
+
+        del events
+
+        tasks_get = app.tasks.__getitem__
+        app_put_result = app.put_result
+
+        def error_backoff(n):
+            # exponential backoff capped at error_timeout, with jitter
+            # so a fleet of workers does not retry the broker in
+            # lockstep after an outage; the exponent is clamped because
+            # n keeps counting during a long outage and 2 ** 1024
+            # overflows float
+            return (min(error_timeout, _BACKOFF_BASE * 2 ** min(n, 30))
+                    * random.uniform(0.5, 1.5))
 
         def put_result(task_id, value, exc=None):
+            n = 0
             while 1:
                 try:
-                    return app.put_result(task_id, value, exc)
+                    return app_put_result(task_id, value, exc)
                 except BrokerError:
-                    if emit_broker_error:
-                        emit('broker_error')
-                    time.sleep(error_timeout)
+                    emit_broker_error('broker_error')
+                    flush()
+                    time.sleep(error_backoff(n))
+                    n += 1
 
-        if emit_worker_start:
-            emit('worker_start')
+        emit_worker_start('worker_start')
+
+        fetch_errors = 0
+        # requests prefetched in the last batch, drained newest-last
+        # so pop() is O(1)
+        backlog = []  # type: typing.List[tuple]
 
         try:
             while not terminated:
                 can_raise = WORKER_INTERRUPT
                 try:
-                    try:
-                        if fetch_timeout > 0:
-                            can_raise = None
-                        ret = app.get_task(queues, fetch_timeout)
-                        # there is a chance to lose the request here
-                        # when the worker stops and fetch_timeout == 0
+                    # deliver everything from the previous iteration
+                    # before blocking on the next fetch
+                    flush()
+                    if backlog:
+                        ret = backlog.pop()
                         can_raise = None
-                    except BrokerError:
-                        if emit_broker_error:
-                            emit('broker_error')
-                        time.sleep(error_timeout)
-                        continue
+                    else:
+                        try:
+                            if fetch_timeout > 0:
+                                can_raise = None
+                            reqs = app.get_tasks(queues, fetch_timeout,
+                                                 fetch_count)
+                            # there is a chance to lose the request here
+                            # when the worker stops and fetch_timeout == 0
+                            can_raise = None
+                        except BrokerError:
+                            emit_broker_error('broker_error')
+                            flush()
+                            time.sleep(error_backoff(fetch_errors))
+                            fetch_errors += 1
+                            continue
 
-                    if ret is None:
-                        continue
+                        if fetch_errors:
+                            fetch_errors = 0
+
+                        if not reqs:
+                            continue
+
+                        reqs.reverse()
+                        backlog = reqs
+                        ret = backlog.pop()
 
                     task_name, request, args, kwargs = ret
 
                     try:
-                        task_class = app.tasks[task_name]
+                        task_class = tasks_get(task_name)
                     except KeyError:
-                        if emit_task_unknown:
-                            emit('task_unknown', task_name=task_name)
+                        emit_task_unknown('task_unknown',
+                                          task_name=task_name)
                         continue
 
                     task = task_class(request)
+                    # one attribute (or __getattr__) lookup each per
+                    # task instead of one per use below
+                    task_run = task.run
+                    task_id = task.id
+                    task_throws = task.throws
+                    task_expires = task.expires
 
                     start_time = get_time()
 
-                    if task.expires and task.expires < start_time:
-                        if emit_task_expires:
-                            emit('task_expires',
-                                 task_name=task_name,
-                                 task_request=request)
+                    if task_expires and task_expires < start_time:
+                        emit_task_expires('task_expires',
+                                          task_name=task_name,
+                                          task_request=request)
                         continue
 
-                    if emit_task_start:
-                        emit('task_start',
-                             task_name=task_name,
-                             task_request=request,
-                             start_time=start_time)
+                    emit_pre_start('task_start',
+                                   task_name=task_name,
+                                   task_request=request,
+                                   start_time=start_time)
+                    # the start event must reach the master while the
+                    # task is still running (TaskKiller arms deadlines
+                    # from it); batching would hold it until the task
+                    # finished. No-op when nothing was buffered.
+                    flush()
 
                     try:
                         can_raise = TASK_INTERRUPT
-                        ret = task.run(*args, **kwargs)
+                        ret = task_run(*args, **kwargs)
                         can_raise = None
 
                     except TaskInterrupt as exc:
-                        put_result(task.id, None, exc)
-                        if emit_task_interrupt:
-                            emit('task_interrupt',
-                                 task_name=task_name,
-                                 task_request=request,
-                                 running_time=get_time() - start_time)
+                        put_result(task_id, None, exc)
+                        emit_late_start('task_start',
+                                        task_name=task_name,
+                                        task_request=request,
+                                        start_time=start_time)
+                        emit_task_interrupt('task_interrupt',
+                                            task_name=task_name,
+                                            task_request=request,
+                                            running_time=get_time() -
+                                            start_time)
                         continue
 
-                    except task.throws as exc:
-                        put_result(task.id, None, exc)
-                        if emit_task_done:
-                            emit('task_done',
+                    except task_throws as exc:
+                        put_result(task_id, None, exc)
+                        if fuse_complete:
+                            emit('task_complete',
                                  task_name=task_name,
                                  task_request=request,
+                                 start_time=start_time,
                                  running_time=get_time() - start_time)
+                        else:
+                            emit_task_done('task_done',
+                                           task_name=task_name,
+                                           task_request=request,
+                                           running_time=get_time() -
+                                           start_time)
                         continue
 
                     except Exception as exc:
-                        put_result(task.id, None, exc)
+                        put_result(task_id, None, exc)
+                        emit_late_start('task_start',
+                                        task_name=task_name,
+                                        task_request=request,
+                                        start_time=start_time)
                         if emit_task_exception:
                             emit('task_exception',
                                  task_name=task_name,
                                  task_request=request,
-                                 exc=exc,
+                                 exc=repr(exc),
                                  traceback=traceback.format_exc(),
                                  running_time=get_time() - start_time
                                  )
                         continue
 
                     else:
-                        put_result(task.id, ret)
-                        if emit_task_done:
-                            emit('task_done',
+                        put_result(task_id, ret)
+                        if fuse_complete:
+                            emit('task_complete',
                                  task_name=task_name,
                                  task_request=request,
+                                 start_time=start_time,
                                  running_time=get_time() - start_time)
+                        else:
+                            emit_task_done('task_done',
+                                           task_name=task_name,
+                                           task_request=request,
+                                           running_time=get_time() -
+                                           start_time)
 
                 except Exception as exc:
                     # Something went wrong
                     if emit_worker_error:
                         emit('worker_error',
-                             exc=exc,
+                             exc=repr(exc),
                              traceback=traceback.format_exc())
 
         except WorkerInterrupt:
             pass
 
+        if backlog:
+            # prefetched but never started: push the requests back so
+            # a warm shutdown does not lose them
+            broker = getattr(app, 'broker', None)
+            if broker is not None:
+                backlog.reverse()
+                try:
+                    for req in backlog:
+                        broker.put_task_req(req[1]['queue'], req)
+                except Exception:
+                    pass
+
+        # best effort only: the master may already be gone
+        try:
+            flush()
+        except BaseException:
+            pass
+
 
 prefork = Prefork